@@ -1,28 +1,90 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import re
+import json
+import queue
+import atexit
 import logging
-import unicodedata
+import functools
+import threading
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
 from abc import ABC, abstractmethod
-from flask import Flask, request, jsonify
+from flask import Flask, request
+
+# orjson 為選用套件，未安裝時改用標準函式庫 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# msgspec 為選用套件，未安裝時只以 StructureValidator 檢查訂單結構
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
 
 # 設定檔
 import config as cfg
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
-class OrderProcessingError(Exception):
-    def __init__(self, message, error_type="Bad Request"):
-        self.message = message
-        self.error_type = error_type
-        super().__init__(self.message)
+def setup_logging():
+    '''
+    將 root logger 既有的 handler 移至背景執行緒的 QueueListener，請求執行緒只需將紀錄放入佇列，
+    避免 I/O 阻塞請求。於程式進入點呼叫 (開發伺服器或 gunicorn 的 post_worker_init)，回傳啟動的 listener
+    '''
+    root = logging.getLogger()
+    handlers = [handler for handler in root.handlers if not isinstance(handler, QueueHandler)]
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+def _compile_price_patterns(currencies):
+    ''' 依各幣別的小數位數預先編譯價格格式的正規表示式 '''
+    return {
+        decimal: re.compile(r"^\d+\.?\d{0," + str(decimal) + r"}$")
+        for decimal, _ in currencies.values()
+    }
+
+# 預先編譯驗證用的正規表示式，避免每次請求重複查詢 re 快取
+_PRICE_RE = _compile_price_patterns(cfg.ALLOWED_CURRENCIES)
+
+# 驗證或轉換失敗時回應的錯誤類型
+ERROR_TYPE = "Bad Request"
 
 class OrderValidator(ABC):
     @abstractmethod
     def validate(self, order_data):
+        '''
+        回傳 (True, None) 或 (False, 錯誤訊息)
+        驗證失敗為常見情況，不以例外處理流程，避免每次錯誤建立 traceback
+        '''
         pass
 
+def _flatten_structure(structure, parent=0, checks=None):
+    '''
+    將巢狀的結構定義依 key 順序攤平成 (容器編號, key, 型態) 清單
+    容器編號 0 為最外層的 dict，之後每個巢狀 dict 依出現順序編號，其欄位緊接在該 dict 之後
+    '''
+    if checks is None:
+        checks = []
+    for key, value_type in structure.items():
+        if type(value_type) is dict:
+            checks.append((parent, key, dict))
+            child = sum(1 for _, _, checked_type in checks if checked_type is dict)
+            _flatten_structure(value_type, child, checks)
+        else:
+            checks.append((parent, key, value_type))
+    return tuple(checks)
+
 class StructureValidator(OrderValidator):
 
     expected_structure = {
@@ -37,120 +99,329 @@ class StructureValidator(OrderValidator):
         "currency": str
     }
 
-    def validate(self, order_data, expected = expected_structure):
+    # 於類別載入時將巢狀結構攤平成檢查清單，驗證時不需遞迴
+    _CHECKS = _flatten_structure(expected_structure)
+
+    def validate(self, order_data):
+        '''
+        order_data 為 JSON 解析結果，只會是 dict、list、str、int、float、bool 或 None 本身，
+        不會是子類別，因此以 type() is 直接比對型態，省去 isinstance 的繼承檢查
+        '''
         # 檢查 order_data 是否為 dict
-        if not isinstance(order_data, dict):
-            raise OrderProcessingError("Invalid order data structure")
+        if type(order_data) is not dict:
+            return False, "Invalid order data structure"
 
-        # 遞迴檢查 order_data 是否符合預期的資料結構與型態
-        for key, value_type in expected.items():
+        # 依 expected_structure 的 key 順序檢查，containers 記錄已檢查過的巢狀 dict
+        containers = [order_data]
+        for parent, key, value_type in self._CHECKS:
+            data = containers[parent]
             # 檢查 key 是否存在
-            if key not in order_data:
-                raise OrderProcessingError(f"Missing key: {key}")
-
-            # 若 value 的 為型態為 dict，則遞迴檢查
-            if isinstance(value_type, dict):
-                if not self.validate(order_data[key], value_type):
-                    return False
-            # 檢查 order_data 的 value 是否為指定型態
-            elif not isinstance(order_data[key], value_type):
-                raise OrderProcessingError(f"Invalid type for key {key}")
-        return True
+            if key not in data:
+                return False, f"Missing key: {key}"
+
+            value = data[key]
+            # 檢查 value 是否為指定型態
+            if type(value) is not value_type:
+                if value_type is dict:
+                    return False, "Invalid order data structure"
+                return False, f"Invalid type for key {key}"
+            if value_type is dict:
+                containers.append(value)
+        return True, None
+
+def _struct_from_structure(name, structure):
+    '''
+    依 expected_structure 建立對應的 msgspec Struct 型別，巢狀 dict 對應為巢狀 Struct
+    未列出的 key 不視為錯誤，與 StructureValidator 相同
+    '''
+    fields = [
+        (key, _struct_from_structure(key.title(), value_type) if type(value_type) is dict else value_type)
+        for key, value_type in structure.items()
+    ]
+    return msgspec.defstruct(name, fields)
+
+class MsgspecValidator(OrderValidator):
+    '''
+    以 msgspec.convert() 在 C 層級檢查已解析的訂單，需安裝 msgspec
+    合法的訂單不需再經過 StructureValidator 的逐欄檢查；
+    不合法時才交由 StructureValidator 找出第一個錯誤，錯誤訊息與未安裝 msgspec 時相同
+    '''
+    def __init__(self):
+        self.fallback = StructureValidator()
+        self._order_type = _struct_from_structure("Order", self.fallback.expected_structure)
+
+    def validate(self, order_data):
+        try:
+            msgspec.convert(order_data, self._order_type)
+        except msgspec.ValidationError:
+            return self.fallback.validate(order_data)
+        return True, None
 
 class OrderTransformer(ABC):
     @abstractmethod
-    def transform(self, order_data):
+    def transform(self, order_data, context=None):
+        '''
+        回傳 (True, 轉換後的 order_data) 或 (False, 錯誤訊息)，與 validate() 相同不以例外處理流程
+        context 為 OrderProcessor 每次請求建立的 dict，供轉換器之間傳遞中間結果，不會出現在回應中
+        單獨呼叫轉換器時可省略
+        '''
         pass
 
+def _validate_name(name):
+    '''
+    檢查訂單名稱，合法時回傳 None，否則回傳錯誤訊息
+    1. 名稱為空或含非 ASCII 字元，則為非英文字元
+    2. 移除空格後若不全為英文字母，則為非英文字元
+    3. 只檢查每個單字的字首是否為大寫
+    皆為 str 內建方法，不經過正規表示式引擎
+    '''
+    if not name or not name.isascii():
+        return "Name contains non-English characters."
+
+    letters = name.replace(' ', '')
+    if letters and not letters.isalpha():
+        return "Name contains non-English characters."
+
+    # 一般的名字 (如 "Melody Holiday Inn") 以 istitle() 一次判斷，
+    # 只有單字內含大寫字母 (如 "McDonald") 才逐字檢查字首
+    if name.istitle():
+        return None
+
+    words = name.split(' ')
+    if not letters or not all(word[0].isupper() for word in words if word):
+        return "Name is not capitalized."
+
+    return None
+
 class NameTransformer(OrderTransformer):
-    def transform(self, order_data):
+    def transform(self, order_data, context=None):
         '''
         1. 訂單名稱若包含非英文字元(不含空格)，則回傳錯誤
         2. 訂單名稱若每個單字的字首字母非大寫，則回傳錯誤
         '''
-        normalized_str = unicodedata.normalize('NFKD', order_data["name"])
-
-        if not re.match("^[A-Za-z ]+$", normalized_str):
-            raise OrderProcessingError("Name contains non-English characters.")
-
-        if not order_data["name"].istitle():
-            raise OrderProcessingError("Name is not capitalized.")
+        error_message = _validate_name(order_data["name"])
+        if error_message is not None:
+            return False, error_message
 
-        return order_data
+        return True, order_data
 
 class PriceTransformer(OrderTransformer):
-    def transform(self, order_data):
+    def transform(self, order_data, context=None):
         '''
         1. 若訂單價格超過 2000，則回傳錯誤
         2. 若訂單價格為負數，則回傳錯誤
         3. 依訂單幣別判斷訂單價格的小數位數是否正確
         '''
-        if float(order_data["price"]) > cfg.MAX_PRICE:
-            raise OrderProcessingError(f"Price is over {cfg.MAX_PRICE}.")
+        # 價格只解析一次，後續檢查與 CurrencyTransformer 皆沿用此數值
+        try:
+            price = float(order_data["price"])
+        except ValueError:
+            return False, "Price is not a number."
+
+        if price > cfg.MAX_PRICE:
+            return False, f"Price is over {cfg.MAX_PRICE}."
         
-        if float(order_data["price"]) < 0:
-            raise OrderProcessingError("Price is negative.")
+        if price < 0:
+            return False, "Price is negative."
         
-        currency_decimal = cfg.ALLOWED_CURRENCIES[order_data["currency"]]
+        currency = cfg.ALLOWED_CURRENCIES.get(order_data["currency"])
+        if currency is None:
+            return False, "Currency format is wrong."
+        currency_decimal, _ = currency
         if currency_decimal == 0:
             if not order_data["price"].isdigit():
-                raise OrderProcessingError("Price has decimal places.")
+                return False, "Price has decimal places."
         else:
-            pattern = r"^\d+\.?\d{0," + str(currency_decimal) + r"}$"
-            if not re.match(pattern, order_data["price"]):
-                raise OrderProcessingError("Price decimal places are wrong.")
-        return order_data
+            if not _PRICE_RE[currency_decimal].match(order_data["price"]):
+                return False, "Price decimal places are wrong."
+
+        if context is not None:
+            context["price"] = price
+        return True, order_data
 
 class CurrencyTransformer(OrderTransformer):
-    def transform(self, order_data):
+    def transform(self, order_data, context=None):
         '''
-        1. 若訂單幣別為 USD，則將價格轉換為 TWD 並更新幣別
-        2. 若訂單幣別非 TWD 或 USD，則回傳錯誤
+        1. 若訂單幣別非 TWD，則依匯率將價格轉換為 TWD 並更新幣別
+        2. 若訂單幣別不在 ALLOWED_CURRENCIES 中，則回傳錯誤
         '''
+        # 沿用 PriceTransformer 解析過的價格
+        price = context.get("price") if context is not None else None
         order_currency = order_data["currency"]
 
-        if order_currency not in cfg.ALLOWED_CURRENCIES.keys():
-            raise OrderProcessingError("Currency format is wrong.")
+        currency = cfg.ALLOWED_CURRENCIES.get(order_currency)
+        if currency is None:
+            return False, "Currency format is wrong."
+        _, rate = currency
 
-        if order_currency == "USD":
-            order_data["price"] = str(round(float(order_data["price"]) * cfg.USD_TO_TWD_RATE))
+        if rate != 1:
+            # 單獨使用時沒有 PriceTransformer 解析過的價格，需自行解析
+            if price is None:
+                try:
+                    price = float(order_data["price"])
+                except ValueError:
+                    return False, "Price is not a number."
+            order_data["price"] = str(round(price * rate))
             order_data["currency"] = "TWD"
-            logger.info(f"Converted price from USD to TWD: {order_data['price']}")
-        return order_data
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"Converted price from {order_currency} to TWD: {order_data['price']}")
+        return True, order_data
 
 class OrderProcessor:
     def __init__(self, validator, transformers):
         self. validator = validator
         self.transformers = transformers
+        self.compile()
 
-    def process(self, order_data):
-        try:
-            logger.info("Starting order processing")
-            if not self.validator.validate(order_data):
-                raise OrderProcessingError("Invalid JSON received")
+    def compile(self):
+        '''
+        將驗證器與所有轉換器預先綁定為單一函式，避免每次請求重複查詢方法與類別名稱
+        若執行期間更換 validator 或 transformers，需重新呼叫 compile()
+        '''
+        validate = self.validator.validate
+        stages = tuple(
+            (transformer.transform, transformer.__class__.__name__)
+            for transformer in self.transformers
+        )
+
+        def _fast_process(order_data):
+            ok, error_message = validate(order_data)
+            if not ok:
+                return False, error_message
 
-            for transformer in self.transformers:
-                order_data = transformer.transform(order_data)
-                logger.info(f"Applied transformer: {transformer.__class__.__name__}")
+            context = {}
+            for transform, name in stages:
+                ok, result = transform(order_data, context)
+                if not ok:
+                    return False, result
+                order_data = result
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(f"Applied transformer: {name}")
+            return True, order_data
 
-            logger.info("Order processing completed successfully")
-            return {"Success": "Order is processed.", "Order_data": order_data}, 200
-        except OrderProcessingError as e:
-            logger.error(f"Order processing failed: {str(e)}")
-            return {"error": e.error_type, "message": str(e)}, 400
+        self._fast_process = _fast_process
+        return _fast_process
+
+    def process(self, order_data):
+        logger.info("Starting order processing")
+        ok, result = self._fast_process(order_data)
+        if not ok:
+            if logger.isEnabledFor(logging.ERROR):
+                logger.error(f"Order processing failed: {result}")
+            return {"error": ERROR_TYPE, "message": result}, 400
+
+        logger.info("Order processing completed successfully")
+        return {"Success": "Order is processed.", "Order_data": result}, 200
 
 app = Flask(__name__)
 
+# 驗證器與轉換器皆為無狀態，於模組載入時建立一次即可重複使用
+_PROCESSOR = OrderProcessor(
+    MsgspecValidator() if msgspec is not None else StructureValidator(),
+    [NameTransformer(), PriceTransformer(), CurrencyTransformer()]
+)
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# 包含所有必要欄位的最短訂單 JSON 長度，較短的請求不可能合法，不需解析
+_MIN_ORDER_BODY_SIZE = len(
+    b'{"id":"","name":"","address":{"city":"","district":"","street":""},"price":"","currency":""}'
+)
+
+class _LRUCache:
+    '''
+    以 OrderedDict 實作的執行緒安全 LRU 快取，超過 maxsize 時移除最久未使用的項目
+    maxsize 為 0 時不保存任何項目
+    '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# 以原始請求內容為 key 快取序列化後的回應 (body, status_code)
+# 相同的請求內容必定得到相同的回應，命中時不需解析、驗證與序列化
+_ORDER_CACHE = _LRUCache(cfg.ORDER_CACHE_SIZE)
+
+def _json_dumps(payload):
+    if orjson is None:
+        return app.json.dumps(payload)
+    return orjson.dumps(payload)
+
+@functools.lru_cache(maxsize=128)
+def _error_body(error_type, message):
+    '''
+    錯誤訊息皆來自程式內的固定字串，序列化結果可重複使用
+    '''
+    return _json_dumps({"error": error_type, "message": message})
+
+def _order_body(response, status_code):
+    '''
+    將 OrderProcessor.process() 的結果序列化，失敗時沿用已序列化的錯誤訊息
+    '''
+    if status_code != 200:
+        return _error_body(response["error"], response["message"])
+    return _json_dumps(response)
+
+def _body_response(body, status_code):
+    return app.response_class(body, status=status_code, mimetype='application/json')
+
+def _error_response(message, error_type=ERROR_TYPE, status_code=400):
+    return _body_response(_error_body(error_type, message), status_code)
+
 @app.route('/api/orders', methods=['POST'])
 def process_order():
-    request_data = request.get_json()
     logger.info("Received new order request")
-    processor = OrderProcessor(
-        StructureValidator(),
-        [NameTransformer(), PriceTransformer(), CurrencyTransformer()]
-    )
-    response, status_code = processor.process(request_data)
-    return jsonify(response), status_code
+    # 與 request.get_json() 相同，只接受 JSON 的 Content-Type
+    if not request.is_json:
+        return _error_response("Content-Type must be application/json.", "Unsupported Media Type", 415)
+
+    raw_data = request.get_data(cache=False)
+    if len(raw_data) < _MIN_ORDER_BODY_SIZE:
+        return _error_response("Invalid JSON received")
+
+    # 超過大小上限的請求不進快取，避免快取佔用過多記憶體
+    cacheable = len(raw_data) <= cfg.ORDER_CACHE_MAX_BODY_SIZE
+    if cacheable:
+        cached = _ORDER_CACHE.get(raw_data)
+        if cached is not None:
+            logger.info("Order served from cache")
+            body, status_code = cached
+            return _body_response(body, status_code)
+
+    try:
+        request_data = _json_loads(raw_data)
+    except ValueError:
+        return _error_response("Invalid JSON received")
+
+    response, status_code = _PROCESSOR.process(request_data)
+    body = _order_body(response, status_code)
+    if cacheable:
+        _ORDER_CACHE.put(raw_data, (body, status_code))
+    return _body_response(body, status_code)
 
 if __name__ == '__main__':
+    setup_logging()
     app.run(port=5000)
\ No newline at end of file
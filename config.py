@@ -1,6 +1,11 @@
 USD_TO_TWD_RATE = 31
 MAX_PRICE = 2000
+# 幣別: (小數位數, 換算為 TWD 的匯率)
 ALLOWED_CURRENCIES = {
-    "TWD": 0,
-    "USD": 2
-}
\ No newline at end of file
+    "TWD": (0, 1),
+    "USD": (2, USD_TO_TWD_RATE)
+}
+# 訂單處理結果的 LRU 快取大小，設為 0 則停用快取
+ORDER_CACHE_SIZE = 4096
+# 只快取不超過此大小 (bytes) 的請求，避免快取大量超長字串
+ORDER_CACHE_MAX_BODY_SIZE = 1024
\ No newline at end of file
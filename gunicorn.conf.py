@@ -0,0 +1,14 @@
+# Gunicorn 設定檔：正式環境改用多個 gevent worker 取代 Flask 開發伺服器
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 4))
+worker_class = "gevent"
+# 保持 HTTP 連線，讓用戶端可重複使用 TCP 連線
+keepalive = 30
+
+def post_worker_init(worker):
+    # 每個 worker 各自啟動背景紀錄執行緒 (執行緒不會隨 fork 複製)，
+    # 需在 gevent monkey patch 之後啟動，因此不使用 post_fork
+    from app import setup_logging
+    setup_logging()
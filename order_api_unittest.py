@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import json
+import atexit
+import logging
 import unittest
 from unittest.mock import Mock, patch
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
 from app import (
-    StructureValidator, NameTransformer, PriceTransformer, 
-    CurrencyTransformer, OrderProcessor, OrderProcessingError
+    app, logger, setup_logging, StructureValidator, MsgspecValidator, NameTransformer, PriceTransformer, 
+    CurrencyTransformer, OrderProcessor,
+    _compile_price_patterns, _LRUCache, _ORDER_CACHE
 )
 import config as cfg
 
@@ -25,7 +33,7 @@ class TestStructureValidator(unittest.TestCase):
             "price": "1000",
             "currency": "TWD"
         }
-        self.assertTrue(self.validator.validate(valid_order))
+        self.assertEqual(self.validator.validate(valid_order), (True, None))
 
     def test_invalid_structure(self):
         ''' 非法的 JSON 結構 '''
@@ -40,8 +48,68 @@ class TestStructureValidator(unittest.TestCase):
             "price": "1000",
             "currency": "TWD"
         }
-        with self.assertRaises(OrderProcessingError):
-            self.validator.validate(invalid_order)
+        ok, _ = self.validator.validate(invalid_order)
+        self.assertFalse(ok)
+
+    def test_invalid_address_structure(self):
+        ''' address 非 dict 的 JSON 結構 '''
+        invalid_order = {
+            "id": "123",
+            "name": "Test Order",
+            "address": "Taipei Xinyi Main St",
+            "price": "1000",
+            "currency": "TWD"
+        }
+        self.assertEqual(self.validator.validate(invalid_order), (False, "Invalid order data structure"))
+
+    def test_missing_keys_reported_in_structure_order(self):
+        ''' 缺少多個 key 時依 expected_structure 的順序回報第一個 '''
+        invalid_order = {
+            "id": "123",
+            "name": "Test Order",
+            "currency": "TWD"
+        }
+        self.assertEqual(self.validator.validate(invalid_order), (False, "Missing key: address"))
+
+@unittest.skipUnless(msgspec, "msgspec 未安裝")
+class TestMsgspecValidator(unittest.TestCase):
+    def setUp(self):
+        self.validator = MsgspecValidator()
+        self.order = {
+            "id": "123",
+            "name": "Test Order",
+            "address": {"city": "Taipei", "district": "Xinyi", "street": "Main St"},
+            "price": "1000",
+            "currency": "TWD"
+        }
+
+    def test_valid_structure(self):
+        ''' 合法的 JSON 結構不需經過 StructureValidator '''
+        self.validator.fallback = Mock()
+        self.assertEqual(self.validator.validate(self.order), (True, None))
+        self.validator.fallback.validate.assert_not_called()
+
+    def test_extra_keys(self):
+        ''' 含有額外 key 的 JSON 結構 '''
+        self.order["note"] = "late check-in"
+        self.order["address"]["floor"] = 3
+        self.assertEqual(self.validator.validate(self.order), (True, None))
+
+    def test_same_errors_as_structure_validator(self):
+        ''' 不合法的 JSON 結構回傳與 StructureValidator 相同的錯誤 '''
+        test_cases = [
+            ("id", 123),
+            ("address", "Taipei Xinyi Main St"),
+            ("address", {"city": "Taipei", "district": "Xinyi"}),
+            ("price", None),
+        ]
+        for key, value in test_cases:
+            with self.subTest(key=key, value=value):
+                order = dict(self.order, **{key: value})
+                self.assertEqual(self.validator.validate(order), StructureValidator().validate(order))
+        order = {"id": "123", "name": "Test Order", "currency": "TWD"}
+        self.assertEqual(self.validator.validate(order), (False, "Missing key: address"))
+        self.assertEqual(self.validator.validate([]), (False, "Invalid order data structure"))
 
 class TestNameTransformer(unittest.TestCase):
     def setUp(self):
@@ -51,21 +119,35 @@ class TestNameTransformer(unittest.TestCase):
         ''' 合法的名字 '''
         order = {"name": "Valid Name"}
         result = self.transformer.transform(order)
-        self.assertEqual(result, order)
+        self.assertEqual(result, (True, order))
+
+    def test_valid_name_inner_capitals(self):
+        ''' 單字內含大寫字母的名字 '''
+        for name in ("McDonald House", "AsiaYo Inn", "Valid  Name"):
+            with self.subTest(name=name):
+                order = {"name": name}
+                self.assertEqual(self.transformer.transform(order), (True, order))
 
     def test_non_english_name(self):
         ''' 含有非英文字元的名字 '''
         order = {"name": "Invalid 名字"}
-        with self.assertRaises(OrderProcessingError) as context:
-            self.transformer.transform(order)
-        self.assertEqual(str(context.exception), "Name contains non-English characters.")
+        self.assertEqual(self.transformer.transform(order), (False, "Name contains non-English characters."))
 
     def test_non_capitalized_name(self):
         ''' 非大寫字母開頭的名字 '''
         order = {"name": "invalid name"}
-        with self.assertRaises(OrderProcessingError) as context:
-            self.transformer.transform(order)
-        self.assertEqual(str(context.exception), "Name is not capitalized.")
+        self.assertEqual(self.transformer.transform(order), (False, "Name is not capitalized."))
+
+    def test_accented_name(self):
+        ''' 含有重音或全形字母的名字 '''
+        for name in ("José", "Ｖalid Name"):
+            with self.subTest(name=name):
+                self.assertEqual(self.transformer.transform({"name": name}), (False, "Name contains non-English characters."))
+
+    def test_empty_name(self):
+        ''' 空白的名字 '''
+        order = {"name": ""}
+        self.assertEqual(self.transformer.transform(order), (False, "Name contains non-English characters."))
 
 class TestPriceTransformer(unittest.TestCase):
     def setUp(self):
@@ -75,23 +157,36 @@ class TestPriceTransformer(unittest.TestCase):
         ''' 合法的價格 '''
         order = {"price": "1000", "currency": "TWD"}
         result = self.transformer.transform(order)
-        self.assertEqual(result, order)
+        self.assertEqual(result, (True, order))
 
     def test_price_over_max(self):
         ''' 價格超過最大限制 '''
         order = {"price": str(cfg.MAX_PRICE + 1), "currency": "TWD"}
-        with self.assertRaises(OrderProcessingError) as context:
-            self.transformer.transform(order)
-        self.assertEqual(str(context.exception), f"Price is over {cfg.MAX_PRICE}.")
+        self.assertEqual(self.transformer.transform(order), (False, f"Price is over {cfg.MAX_PRICE}."))
 
     def test_negative_price(self):
         ''' 負數價格 '''
         order = {"price": "-100", "currency": "TWD"}
-        with self.assertRaises(OrderProcessingError) as context:
-            self.transformer.transform(order)
-        self.assertEqual(str(context.exception), "Price is negative.")
+        self.assertEqual(self.transformer.transform(order), (False, "Price is negative."))
+
+    def test_non_numeric_price(self):
+        ''' 非數字價格 '''
+        order = {"price": "abc", "currency": "TWD"}
+        self.assertEqual(self.transformer.transform(order), (False, "Price is not a number."))
+
+    def test_parsed_price_handoff(self):
+        ''' 解析後的價格交給 CurrencyTransformer 沿用 '''
+        order = {"price": "1000.50", "currency": "USD"}
+        context = {}
+        result = self.transformer.transform(order, context)
+        self.assertEqual(result, (True, {"price": "1000.50", "currency": "USD"}))
+        self.assertEqual(context["price"], 1000.5)
+
+    # 價格格式的正規表示式於載入時依設定編譯，替換設定時需一併替換
+    _CURRENCIES = {'TWD': (0, 1), 'USD': (2, cfg.USD_TO_TWD_RATE)}
 
-    @patch('config.ALLOWED_CURRENCIES', {'TWD': 0, 'USD': 2})
+    @patch('config.ALLOWED_CURRENCIES', _CURRENCIES)
+    @patch('app._PRICE_RE', _compile_price_patterns(_CURRENCIES))
     def test_price_decimal_places(self):
         ''' 測試不同貨幣的價格小數位數 '''
         test_cases = [
@@ -108,11 +203,9 @@ class TestPriceTransformer(unittest.TestCase):
                 order = {"price": price, "currency": currency}
                 if should_pass:
                     result = self.transformer.transform(order)
-                    self.assertEqual(result, order)
+                    self.assertEqual(result, (True, order))
                 else:
-                    with self.assertRaises(OrderProcessingError) as context:
-                        self.transformer.transform(order)
-                    self.assertEqual(str(context.exception), error_message)
+                    self.assertEqual(self.transformer.transform(order), (False, error_message))
 
 class TestCurrencyTransformer(unittest.TestCase):
     def setUp(self):
@@ -122,21 +215,32 @@ class TestCurrencyTransformer(unittest.TestCase):
         ''' TWD 幣別 '''
         order = {"currency": "TWD", "price": "1000"}
         result = self.transformer.transform(order)
-        self.assertEqual(result, order)
+        self.assertEqual(result, (True, order))
 
     def test_usd_currency(self):
         ''' USD 幣別 '''
         order = {"currency": "USD", "price": "100"}
-        result = self.transformer.transform(order)
+        ok, result = self.transformer.transform(order)
+        self.assertTrue(ok)
         self.assertEqual(result["currency"], "TWD")
         self.assertEqual(result["price"], str(int(100 * cfg.USD_TO_TWD_RATE)))
 
+    def test_usd_currency_with_parsed_price(self):
+        ''' 沿用 PriceTransformer 解析後的價格 '''
+        context = {}
+        _, order = PriceTransformer().transform({"currency": "USD", "price": "10.50"}, context)
+        result = self.transformer.transform(order, context)
+        self.assertEqual(result, (True, {"currency": "TWD", "price": str(round(10.5 * cfg.USD_TO_TWD_RATE))}))
+
+    def test_usd_currency_non_numeric_price(self):
+        ''' 單獨使用時遇到非數字價格 '''
+        order = {"currency": "USD", "price": "abc"}
+        self.assertEqual(self.transformer.transform(order), (False, "Price is not a number."))
+
     def test_invalid_currency(self):
         ''' 錯誤的幣別 '''
         order = {"currency": "EUR", "price": "100"}
-        with self.assertRaises(OrderProcessingError) as context:
-            self.transformer.transform(order)
-        self.assertEqual(str(context.exception), "Currency format is wrong.")
+        self.assertEqual(self.transformer.transform(order), (False, "Currency format is wrong."))
 
 class TestOrderProcessor(unittest.TestCase):
     def setUp(self):
@@ -147,9 +251,9 @@ class TestOrderProcessor(unittest.TestCase):
     def test_valid_order(self):
         ''' 合法的訂單 '''
         order_data = {"test": "data"}
-        self.validator.validate.return_value = True
+        self.validator.validate.return_value = (True, None)
         for transformer in self.transformers:
-            transformer.transform.return_value = order_data
+            transformer.transform.return_value = (True, order_data)
 
         result, status_code = self.processor.process(order_data)
         self.assertEqual(status_code, 200)
@@ -158,7 +262,7 @@ class TestOrderProcessor(unittest.TestCase):
     def test_invalid_structure(self):
         ''' 非法的 JSON 結構 '''
         order_data = {"test": "data"}
-        self.validator.validate.side_effect = OrderProcessingError("Invalid JSON received")
+        self.validator.validate.return_value = (False, "Invalid JSON received")
 
         result, status_code = self.processor.process(order_data)
         self.assertEqual(status_code, 400)
@@ -168,13 +272,159 @@ class TestOrderProcessor(unittest.TestCase):
     def test_transformation_error(self):
         ''' 轉換過程中發生錯誤 '''
         order_data = {"test": "data"}
-        self.validator.validate.return_value = True
-        self.transformers[0].transform.side_effect = OrderProcessingError("Test error")
+        self.validator.validate.return_value = (True, None)
+        self.transformers[0].transform.return_value = (False, "Test error")
 
         result, status_code = self.processor.process(order_data)
         self.assertEqual(status_code, 400)
         self.assertIn("error", result)
         self.assertEqual(result["message"], "Test error")
 
+    def test_price_only_pipeline(self):
+        ''' 只有 PriceTransformer 時回應不含內部欄位 '''
+        order_data = {
+            "id": "123",
+            "name": "Test Order",
+            "address": {"city": "Taipei", "district": "Xinyi", "street": "Main St"},
+            "price": "10.50",
+            "currency": "USD"
+        }
+        processor = OrderProcessor(StructureValidator(), [PriceTransformer()])
+        result, status_code = processor.process(dict(order_data))
+        self.assertEqual(status_code, 200)
+        self.assertEqual(result["Order_data"], order_data)
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        ''' 超過大小上限時移除最久未使用的項目 '''
+        cache = _LRUCache(2)
+        cache.put(b"a", 1)
+        cache.put(b"b", 2)
+        cache.get(b"a")
+        cache.put(b"c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(b"b"))
+        self.assertEqual(cache.get(b"a"), 1)
+
+    def test_zero_size_disables_cache(self):
+        ''' 大小設為 0 時不保存任何項目 '''
+        cache = _LRUCache(0)
+        cache.put(b"a", 1)
+        self.assertIsNone(cache.get(b"a"))
+
+class TestOrderAPI(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.order = {
+            "id": "A0000001",
+            "name": "Melody Holiday Inn",
+            "address": {
+                "city": "taipei-city",
+                "district": "da-an-district",
+                "street": "fuxing-south-road"
+            },
+            "price": "2000",
+            "currency": "TWD"
+        }
+
+    def post_order(self, **fields):
+        ''' 以 setUp 的訂單為基礎，覆寫指定欄位後送出 '''
+        return self.client.post('/api/orders', json=dict(self.order, **fields))
+
+    def test_valid_order(self):
+        ''' 合法的訂單請求 '''
+        response = self.post_order(price="50", currency="USD")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/json')
+        result = response.get_json()["Order_data"]
+        self.assertEqual(result["price"], str(50 * cfg.USD_TO_TWD_RATE))
+        self.assertEqual(result["currency"], "TWD")
+
+    def test_order_with_extra_keys(self):
+        ''' 含有額外 key 的訂單請求照原樣回傳額外欄位 '''
+        response = self.post_order(note="late check-in")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["Order_data"], dict(self.order, note="late check-in"))
+
+    def test_repeated_order_uses_cache(self):
+        ''' 重複的訂單請求使用快取結果 '''
+        _ORDER_CACHE.clear()
+        first = self.post_order()
+        with self.assertLogs('app', level='INFO') as logs:
+            second = self.post_order()
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(second.status_code, 200)
+        self.assertIn("INFO:app:Order served from cache", logs.output)
+        self.assertNotIn("INFO:app:Starting order processing", logs.output)
+
+    def test_oversized_order_bypasses_cache(self):
+        ''' 超過快取大小上限的訂單請求不進快取 '''
+        _ORDER_CACHE.clear()
+        response = self.post_order(name="A" * cfg.ORDER_CACHE_MAX_BODY_SIZE)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(_ORDER_CACHE), 0)
+
+    def test_error_response_reused(self):
+        ''' 相同錯誤訊息重複使用序列化結果 '''
+        first = self.post_order(id="A0000003", name="invalid name")
+        second = self.post_order(id="A0000004", name="invalid name")
+        self.assertEqual(second.status_code, 400)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(second.get_json(), {"error": "Bad Request", "message": "Name is not capitalized."})
+
+    def test_invalid_currency(self):
+        ''' 不支援幣別的訂單請求 '''
+        response = self.post_order(price="100", currency="EUR")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["message"], "Currency format is wrong.")
+
+    def test_invalid_json(self):
+        ''' 無法解析的 JSON 請求 '''
+        response = self.client.post('/api/orders', data=b'{"id": ' + b' ' * 100, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["message"], "Invalid JSON received")
+
+    def test_non_json_content_type(self):
+        ''' 非 JSON Content-Type 的請求 '''
+        body = json.dumps(self.order)
+        response = self.client.post('/api/orders', data=body, content_type='text/plain')
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(response.get_json(), {
+            "error": "Unsupported Media Type", "message": "Content-Type must be application/json."
+        })
+
+    def test_empty_json(self):
+        ''' 過短而不可能合法的 JSON 請求 '''
+        for body in (b'', b'{}', b'{"id": "1"}'):
+            with self.subTest(body=body):
+                response = self.client.post('/api/orders', data=body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.get_json()["message"], "Invalid JSON received")
+
+class TestLogging(unittest.TestCase):
+    def test_request_is_logged(self):
+        ''' app logger 的紀錄會傳遞至 root logger '''
+        with self.assertLogs(level=logging.INFO) as logs:
+            app.test_client().post('/api/orders', data=b'{}', content_type='application/json')
+        self.assertIn("INFO:app:Received new order request", logs.output)
+
+    def test_setup_logging_queue_handoff(self):
+        ''' setup_logging() 後紀錄經由佇列送達原本的 handler '''
+        root = logging.getLogger()
+        original_handlers = root.handlers[:]
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        root.handlers = [handler]
+        try:
+            listener = setup_logging()
+            self.assertNotIn(handler, root.handlers)
+            logger.info("queued record")
+            atexit.unregister(listener.stop)
+            listener.stop()
+        finally:
+            root.handlers = original_handlers
+        self.assertEqual([record.getMessage() for record in records], ["queued record"])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file